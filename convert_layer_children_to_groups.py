@@ -34,13 +34,19 @@ class ConvertLayerChildrenToGroups(inkex.EffectExtension):
 
         converted_count = 0
 
+        # Resolve the namespaced attribute name once instead of re-running
+        # addNS's lookup and string formatting for every child; bind the
+        # Layer class to a local for the isinstance calls in the loop.
+        groupmode_key = inkex.addNS('groupmode', 'inkscape')
+        layer_cls = Layer
+
         for child in children:
             # Only convert child layers to groups
-            if isinstance(child, Layer):
+            if isinstance(child, layer_cls):
                 try:
                     # Remove layer-specific attributes to convert it to a regular group
-                    if child.get(inkex.addNS('groupmode', 'inkscape')) == 'layer':
-                        child.attrib.pop(inkex.addNS('groupmode', 'inkscape'), None)
+                    if child.get(groupmode_key) == 'layer':
+                        child.attrib.pop(groupmode_key, None)
 
                     # The element is now effectively a group since it loses its layer properties
                     # but maintains all its content, transform, and other attributes
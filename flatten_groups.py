@@ -9,6 +9,12 @@ Accounts for relative positioning by combining transforms.
 import inkex
 from inkex import Group, Layer
 from inkex.transforms import Transform
+from collections import deque
+
+# Shared identity used whenever an element has no transform attribute.
+# It is only ever read (matmul returns a new Transform), so one module
+# level instance replaces an allocation per element visited.
+_IDENTITY = Transform()
 
 class FlattenGroups(inkex.EffectExtension):
 
@@ -36,25 +42,22 @@ class FlattenGroups(inkex.EffectExtension):
             return
 
         total_moved = 0
-        processed_ids = set()  # To avoid infinite recursion
-
-        # Process elements (this list will grow as we move nested elements out)
-        i = 0
-        while i < len(elements_to_process):
-            element = elements_to_process[i]
-            element_id = element.get('id')
 
-            # Skip if we've already processed this element
-            if element_id in processed_ids:
-                i += 1
-                continue
+        # Process elements from a deque, gating on identity at enqueue time
+        # so nothing is ever re-enqueued or re-scanned. The set holds the
+        # elements themselves (lxml proxies hash by identity): storing raw
+        # id() integers would let a garbage-collected proxy's address be
+        # reused and false-positive a later element out of the queue.
+        queue = deque(elements_to_process)
+        seen = set(elements_to_process)
 
-            processed_ids.add(element_id)
+        while queue:
+            element = queue.popleft()
+            element_id = element.get('id')
 
             # Get the parent of current element
             parent = element.getparent()
             if parent is None:
-                i += 1
                 continue
 
             # Get immediate children that are groups or layers (NOT paths or other elements)
@@ -64,17 +67,24 @@ class FlattenGroups(inkex.EffectExtension):
                     container_children.append(child)
 
             if not container_children:
-                i += 1
                 continue
 
             # Get ELEMENT'S transform (not parent's) - THIS IS THE FIX
-            element_transform = Transform(element.get('transform')) if element.get('transform') else Transform()
+            # Fetch the attribute once and only parse it if present
+            element_tr = element.get('transform')
+            element_transform = Transform(element_tr) if element_tr else _IDENTITY
+
+            # Find the insertion point once; lxml's index() is a linear
+            # scan over siblings, so calling it per moved child is O(n^2).
+            # Inserts happen after `element`, so its own index never moves.
+            insert_at = parent.index(element) + 1
 
             # Move each container child to be a sibling of the current element
             for child in container_children:
                 try:
                     # Get child's current transform
-                    child_transform = Transform(child.get('transform')) if child.get('transform') else Transform()
+                    child_tr = child.get('transform')
+                    child_transform = Transform(child_tr) if child_tr else _IDENTITY
 
                     # Combine transforms: child's new transform = element_transform * child_transform
                     new_transform = element_transform @ child_transform
@@ -82,18 +92,24 @@ class FlattenGroups(inkex.EffectExtension):
                     # Remove child from current element
                     element.remove(child)
 
-                    # Set the combined transform on the child
-                    if new_transform != Transform():
-                        child.set('transform', str(new_transform))
-                    else:
+                    # Set the combined transform on the child; compare the
+                    # raw matrix rows rather than allocating a fresh
+                    # identity Transform per child just to test equality
+                    m = new_transform.matrix
+                    if m[0] == (1.0, 0.0, 0.0) and m[1] == (0.0, 1.0, 0.0):
                         # Remove transform if it's identity
                         child.attrib.pop('transform', None)
+                    else:
+                        child.set('transform', str(new_transform))
 
                     # Insert child as sibling after the current element
-                    parent.insert(parent.index(element) + 1, child)
+                    parent.insert(insert_at, child)
+                    insert_at += 1
 
-                    # Add the moved child to our processing list so we can process it too
-                    elements_to_process.append(child)
+                    # Add the moved child to our queue so we can process it too
+                    if child not in seen:
+                        seen.add(child)
+                        queue.append(child)
 
                     total_moved += 1
                     inkex.utils.debug(f"Moved {child.get('id')} out of {element_id}")
@@ -103,8 +119,6 @@ class FlattenGroups(inkex.EffectExtension):
                     inkex.errormsg(f"Error moving {child.get('id')}: {str(e)}")
                     continue
 
-            i += 1
-
         inkex.utils.debug(f"Flattening complete. Moved {total_moved} groups/layers.")
 
 if __name__ == '__main__':
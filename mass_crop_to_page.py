@@ -8,76 +8,123 @@ Adjusted so the clip rectangle accounts for ancestor group translations.
 """
 
 import inkex
-from inkex import PathElement, Rectangle
-from inkex.paths import Path, CubicSuperPath
+from inkex import Group, PathElement, Rectangle
 from inkex.transforms import Transform
-import copy
+import numpy as np
+import re
+from collections import deque
 from math import isclose
 
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional: without it the helpers below simply run as
+    # plain Python, which is still fine for typical documents.
+    def njit(*args, **kwargs):
+        def wrap(func):
+            return func
+        return wrap
+
 # --- helper functions (put inside your class or module) ---
-def _transform_to_matrix(transform_obj):
+# Most ancestor transforms in real documents are a plain translate(x,y)
+# (or translate(x)); recognizing those with a precompiled regex avoids
+# running the full Transform tokenizer for the common case.
+_TRANSLATE_RE = re.compile(
+    r'^\s*translate\(\s*([-+\d.eE]+)(?:[\s,]+([-+\d.eE]+))?\s*\)\s*$')
+
+def _parse_translate(tr):
+    """Return (dx, dy) if `tr` is a pure translate() string, else None."""
+    m = _TRANSLATE_RE.match(tr)
+    if m is None:
+        return None
+    try:
+        return float(m[1]), float(m[2]) if m[2] else 0.0
+    except ValueError:
+        # The character class is looser than float() ("5e", "1.2.3");
+        # treat those as a miss and let the caller's fallback decide.
+        return None
+
+# Affine transforms are represented as flat 6-tuples (a, b, c, d, e, f),
+# i.e. the SVG matrix(a,b,c,d,e,f) form. The implicit last row of the 3x3
+# matrix is always [0, 0, 1], so carrying it around (and multiplying by
+# it) is pure overhead - the specialized forms below do 6 multiplies per
+# composition instead of 27 and allocate a single flat tuple.
+
+_IDENTITY_AFFINE = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+# Quantization grid for the clip-rectangle cache. Accumulated
+# translations that differ only by float noise (100.0000001 vs 100.0)
+# must fuse to the same <clipPath>; 1e-4 svg-units is far below anything
+# visible but coarse enough to absorb rounding drift.
+_CLIP_QUANTUM = 1e-4
+
+def _bucket(v):
+    """Snap a coordinate to the clip-cache quantization grid."""
+    return round(v / _CLIP_QUANTUM) * _CLIP_QUANTUM
+
+# Subtrees that never contain on-canvas paths. Not descending into them
+# skips pointless work and keeps the crop away from <defs> content such
+# as existing clipPath/marker shapes, which the old //svg:path query
+# used to pick up.
+_SKIP_TAGS = frozenset({
+    inkex.addNS('defs', 'svg'),
+    inkex.addNS('metadata', 'svg'),
+    inkex.addNS('style', 'svg'),
+    inkex.addNS('script', 'svg'),
+    inkex.addNS('title', 'svg'),
+    inkex.addNS('desc', 'svg'),
+    inkex.addNS('namedview', 'sodipodi'),
+})
+
+def _parse_affine(tr):
     """
-    Convert an inkex.Transform object (or None) into a 3x3 numeric matrix:
-      [[a, c, e],
-       [b, d, f],
-       [0, 0, 1]]
-    inkex.Transform instances expose a .matrix or repr like Transform(((a,c,e),(b,d,f)))
+    Parse a transform attribute string into a flat affine 6-tuple
+    (a, b, c, d, e, f). Unparseable strings are treated as identity.
     """
-    if transform_obj is None:
-        return [[1.0, 0.0, 0.0],
-                [0.0, 1.0, 0.0],
-                [0.0, 0.0, 1.0]]
-    # transform_obj.matrix or transform_obj.__repr__ gives ((a,c,e),(b,d,f))
+    translation = _parse_translate(tr)
+    if translation is not None:
+        return (1.0, 0.0, 0.0, 1.0, translation[0], translation[1])
     try:
-        mm = transform_obj.matrix  # usually ((a,c,e),(b,d,f))
+        T = Transform(tr)
+        return (float(T.a), float(T.b), float(T.c),
+                float(T.d), float(T.e), float(T.f))
     except Exception:
-        # fallback: try to get transform string and build Transform
-        mm = Transform(str(transform_obj)).matrix
-
-    a, c, e = mm[0]
-    b, d, f = mm[1]
-    return [[float(a), float(c), float(e)],
-            [float(b), float(d), float(f)],
-            [0.0, 0.0, 1.0]]
+        # If transform can't be parsed safely, ignore it
+        return _IDENTITY_AFFINE
 
+@njit(cache=True, fastmath=True)
 def _mat_mult(A, B):
-    """Multiply 3x3 matrices A*B"""
-    return [
-        [A[0][0]*B[0][0] + A[0][1]*B[1][0] + A[0][2]*B[2][0],
-         A[0][0]*B[0][1] + A[0][1]*B[1][1] + A[0][2]*B[2][1],
-         A[0][0]*B[0][2] + A[0][1]*B[1][2] + A[0][2]*B[2][2]],
-        [A[1][0]*B[0][0] + A[1][1]*B[1][0] + A[1][2]*B[2][0],
-         A[1][0]*B[0][1] + A[1][1]*B[1][1] + A[1][2]*B[2][1],
-         A[1][0]*B[0][2] + A[1][1]*B[1][2] + A[1][2]*B[2][2]],
-        [0.0, 0.0, 1.0]
-    ]
-
+    """Compose affine 6-tuples: A*B (A applied after B)."""
+    a1, b1, c1, d1, e1, f1 = A
+    a2, b2, c2, d2, e2, f2 = B
+    return (a1 * a2 + c1 * b2,
+            b1 * a2 + d1 * b2,
+            a1 * c2 + c1 * d2,
+            b1 * c2 + d1 * d2,
+            a1 * e2 + c1 * f2 + e1,
+            b1 * e2 + d1 * f2 + f1)
+
+@njit(cache=True, fastmath=True)
 def _mat_inverse(M):
-    """Inverse of a 3x3 affine matrix where last row is [0,0,1].
-       Returns None if not invertible.
+    """Inverse of an affine 6-tuple.
+
+    The caller must check the determinant first (see _mat_det); keeping
+    the singular case out of here lets numba compile a single tuple
+    return type.
     """
-    a, c, e = M[0]
-    b, d, f = M[1]
-    det = a * d - b * c
-    if isclose(det, 0.0, abs_tol=1e-12):
-        return None
-    inv_det = 1.0 / det
-    # inverse of [[a,c,e],[b,d,f],[0,0,1]] is:
-    ai =  d * inv_det
-    bi = -b * inv_det
-    ci = -c * inv_det
-    di =  a * inv_det
-    ei = (c * f - d * e) * inv_det
-    fi = (b * e - a * f) * inv_det
-    return [[ai, ci, ei],
-            [bi, di, fi],
-            [0.0, 0.0, 1.0]]
-
-def _apply_mat_to_point(M, x, y):
-    """Apply 3x3 matrix M to point (x,y)."""
-    nx = M[0][0]*x + M[0][1]*y + M[0][2]
-    ny = M[1][0]*x + M[1][1]*y + M[1][2]
-    return nx, ny
+    a, b, c, d, e, f = M
+    inv_det = 1.0 / (a * d - b * c)
+    return (d * inv_det,
+            -b * inv_det,
+            -c * inv_det,
+            a * inv_det,
+            (c * f - d * e) * inv_det,
+            (b * e - a * f) * inv_det)
+
+@njit(cache=True, fastmath=True)
+def _mat_det(M):
+    """Determinant of an affine 6-tuple."""
+    return M[0] * M[3] - M[1] * M[2]
 
 class MassCropToPage(inkex.EffectExtension):
 
@@ -85,174 +132,247 @@ class MassCropToPage(inkex.EffectExtension):
         svg = self.document.getroot()
         # Get the page bounding box
         page_bbox: BoundingBox = self.svg.get_page_bbox()
-        page_left = page_bbox.left
-        page_top = page_bbox.top
-        page_width = page_bbox.width
-        width = page_width
-        page_height = page_bbox.height
-        height = page_height
-
-        # Now create your path for rectangle over that bbox
-        rect_path = f"M{page_left},{page_top} " \
-                    f"L{page_left + page_width},{page_top} " \
-                    f"L{page_left + page_width},{page_top + page_height} " \
-                    f"L{page_left},{page_top + page_height} Z"
-        rect_csp = CubicSuperPath(Path(rect_path).to_absolute())
-
-        # Find all path elements
-        paths_list = svg.xpath('//svg:path', namespaces=inkex.NSS)
-
-        for path in paths_list:
-            try:
-                # Get the path data as CubicSuperPath
-                path_csp = CubicSuperPath(path.path.to_absolute())
-
-                # Perform intersection (this is a simplified approach)
-                # For complex boolean operations, we'd need additional libraries
-                # This approach keeps paths that are within the rectangle bounds
-                self.crop_path_to_rect(path, path_csp, rect_csp, width, height)
-
-            except Exception as e:
-                inkex.errormsg(f"Error processing path {path.get('id')}: {str(e)}")
-                continue
-
-    def crop_path_to_rect(self, path, path_csp, rect_csp, width, height):
-        """Crop path to rectangle bounds using a bounding box approach"""
+        width = page_bbox.width
+        height = page_bbox.height
+
+        # All paths sharing the same accumulated translation get an
+        # identical clip rectangle, so one <clipPath> per distinct
+        # rectangle is enough; cache ids keyed by the rect geometry.
+        self._clip_cache = {}
+
+        # Homogeneous page-rectangle corners, built once; every clip that
+        # needs the matrix path maps all four in a single matmul.
+        self._page_corners = np.array(
+            [[0.0, width, width, 0.0],
+             [0.0, 0.0, height, height],
+             [1.0, 1.0, 1.0, 1.0]], dtype=np.float64)
+
+        # Make sure <defs> exists once, instead of checking per clipped path
+        if self.svg.defs is None:
+            self.svg.append(inkex.Defs())
+
+        # New <clipPath> elements are collected here and written into
+        # <defs> in one extend() after the walk - one libxml insertion
+        # pass instead of a parent-pointer fixup per clipped path.
+        self._pending_clips = []
+
+        # get_unique_id scans the document's ids; do that once to reserve
+        # a unique prefix and mint all further clip ids from a counter.
+        self._clip_id_base = self.svg.get_unique_id('clip_')
+        self._clip_counter = 0
+
+        # Walk the tree once with an explicit stack instead of an XPath
+        # query: no XPath compilation, no intermediate list, no recursion cap.
+        # Each stack entry carries the full cumulative ancestor transform as
+        # an affine 6-tuple, so no path ever re-walks up to the root: two
+        # paths under the same group share the exact same composed matrix
+        # instead of each redoing every multiply along the chain.
+        # Alongside each cumulative matrix rides a one-slot cell for its
+        # lazily computed inverse: 500 sibling paths under the same group
+        # invert the shared matrix once, not 500 times.
+        stack = deque([(svg, _IDENTITY_AFFINE, [None])])
+        while stack:
+            node, cum, inv_cell = stack.pop()
+
+            if isinstance(node, PathElement):
+                # Only the bounding box is ever inspected; clipping is done
+                # via clip-path, so there is no need to materialize the
+                # path data itself.
+                self.crop_path_to_rect(node, cum, inv_cell, width, height)
+            else:
+                # Coarse accept/reject on whole groups: one group-level
+                # bbox decides for every descendant path at once. A group
+                # fully inside the page needs no clipping anywhere below
+                # it; one fully outside is dropped wholesale. Only valid
+                # while the ancestor chain is pure translation (the bbox
+                # already includes the group's own transform).
+                if (isinstance(node, Group) and
+                        cum[0] == 1.0 and cum[1] == 0.0 and
+                        cum[2] == 0.0 and cum[3] == 1.0):
+                    try:
+                        g_bbox = node.bounding_box()
+                    except Exception:
+                        # A malformed transform anywhere in the subtree
+                        # makes bounding_box() raise; skip the shortcut
+                        # and descend normally, where every parse is
+                        # guarded.
+                        g_bbox = None
+                    if g_bbox is not None:
+                        tx, ty = cum[4], cum[5]
+                        if (g_bbox.left + tx >= 0 and
+                                g_bbox.right + tx <= width and
+                                g_bbox.top + ty >= 0 and
+                                g_bbox.bottom + ty <= height):
+                            continue
+                        if (g_bbox.right + tx < 0 or
+                                g_bbox.left + tx > width or
+                                g_bbox.bottom + ty < 0 or
+                                g_bbox.top + ty > height):
+                            node.getparent().remove(node)
+                            continue
+
+                # Parse this container's transform exactly once and fold it
+                # into the cumulative matrix its children inherit. A new
+                # matrix needs a new inverse cell; an unchanged one keeps
+                # sharing the parent's.
+                tr = node.get('transform')
+                if tr:
+                    cum = _mat_mult(cum, _parse_affine(tr))
+                    inv_cell = [None]
+                for child in node:
+                    if child.tag not in _SKIP_TAGS:
+                        stack.append((child, cum, inv_cell))
+
+        if self._pending_clips:
+            self.svg.defs.extend(self._pending_clips)
+
+    def _next_clip_id(self):
+        """Mint the next clip id from the prefix reserved in effect()."""
+        clip_id = f'{self._clip_id_base}_{self._clip_counter}'
+        self._clip_counter += 1
+        return clip_id
+
+    def crop_path_to_rect(self, path, cum, inv_cell, width, height):
+        """Crop path to rectangle bounds using a bounding box approach.
+
+        `cum` is the cumulative ancestor transform composed during the tree
+        walk as an affine 6-tuple; when it is a pure translation the cheap
+        rectangle clip applies, otherwise the matrix path is needed.
+        """
         try:
+            a, b, c, d, tx, ty = cum
+            translates_only = (a == 1.0 and b == 0.0 and
+                               c == 0.0 and d == 1.0)
+
             # Get bounding box of the path
             bbox = path.bounding_box()
 
             if bbox is None:
                 return
 
-            # If path is completely inside rectangle, leave it as is
-            if (bbox.left >= 0 and bbox.right <= width and
-                bbox.top >= 0 and bbox.bottom <= height):
+            # If path is completely inside rectangle, leave it as is.
+            # Like the other bbox shortcuts, this is only meaningful when
+            # the ancestor chain is pure translation - under rotation or
+            # scale, tx/ty are just matrix entries and the comparison says
+            # nothing about the document-space position.
+            if translates_only and (bbox.left + tx >= 0 and bbox.right + tx <= width and
+                                    bbox.top + ty >= 0 and bbox.bottom + ty <= height):
                 return  # Path is already within bounds
 
+            # If path is completely outside the rectangle, clipping would
+            # erase it anyway - drop the element instead of paying for a
+            # <clipPath> that renders nothing. Only safe when the ancestor
+            # chain is pure translation, otherwise the bbox test above
+            # doesn't describe the document-space position.
+            if translates_only and (bbox.right + tx < 0 or bbox.left + tx > width or
+                                    bbox.bottom + ty < 0 or bbox.top + ty > height):
+                path.getparent().remove(path)
+                return
+
             # For paths that cross boundaries, we need to use clip operations
             # Since direct boolean ops are problematic, we'll use a simpler approach
             # by setting clip-path (alternative method)
-            self.apply_clip_to_path(path, width, height)
+            if translates_only:
+                # The clip resolves in the path's own user space, so the
+                # path's own transform counts too, exactly as the matrix
+                # branch folds it into cum. A pure-translate own transform
+                # just shifts the rectangle; anything else needs the full
+                # matrix treatment after all.
+                own_tr = path.get('transform')
+                if own_tr:
+                    own = _parse_translate(own_tr)
+                    if own is None:
+                        self.apply_clip_to_path(path, cum, inv_cell,
+                                                width, height)
+                        return
+                    tx += own[0]
+                    ty += own[1]
+                self.apply_clip_with_translation(path, tx, ty, width, height)
+            else:
+                self.apply_clip_to_path(path, cum, inv_cell, width, height)
 
         except Exception as e:
             inkex.errormsg(f"Error cropping path {path.get('id')}: {str(e)}")
 
-    def get_ancestor_translation(self, element):
+    def apply_clip_with_translation(self, path, tx, ty, width, height,
+                                    page_left=0.0, page_top=0.0):
         """
-        Walk up the ancestor chain and accumulate translation components
-        from ancestor transform attributes.
+        Create a clipPath that clips `path` to the page rectangle, using a
+        translation already accumulated by the caller. This is the fast path
+        for the common case where every ancestor transform is a pure
+        translate: no ancestor walk, no matrix inversion.
 
-        We only extract the translation (e, f) from the 2D affine matrix and
-        sum them. This avoids computing or applying inverse transforms,
-        and matches 'positions of groups' as requested.
-        """
-        tx = 0.0
-        ty = 0.0
-
-        parent = element.getparent()
-        while parent is not None:
-            tr = parent.get('transform')
-            if tr:
-                try:
-                    T = Transform(tr)
-                    # In the 2D matrix a b c d e f, e and f are the translation
-                    tx += float(T.e)
-                    ty += float(T.f)
-                except Exception:
-                    # If transform can't be parsed safely, ignore it
-                    pass
-            parent = parent.getparent()
-
-        return tx, ty
-
-    # --- replace your apply_clip_to_path with the version below ---
-    def apply_clip_to_path(self, path, width, height, page_left=0.0, page_top=0.0):
-        """
-        Create a clipPath that clips `path` to the rectangle
-        (page_left,page_top)-(page_left+width,page_top+height),
-        correctly accounting for arbitrary ancestor+own transforms.
+        Paths with the same accumulated translation share one <clipPath>
+        instead of each allocating their own.
         """
-        # 1) compute cumulative transform from root -> element (include element)
-        #    We'll multiply ancestor matrices in document order (root first).
-        ancestors = []
-        el = path
-        while el is not None:
-            ancestors.append(el)
-            el = el.getparent()
-        # ancestors is [element, parent, ..., root]; we want root..element order
-        ancestors = list(reversed(ancestors))
-
-        cum = [[1.0, 0.0, 0.0],
-            [0.0, 1.0, 0.0],
-            [0.0, 0.0, 1.0]]
-        for anc in ancestors:
-            # anc.transform returns a Transform object or default Transform()
-            tr = None
-            try:
-                tr = anc.transform if hasattr(anc, 'transform') else None
-            except Exception:
-                # if anything goes wrong, skip this ancestor transform
-                tr = None
-            m = _transform_to_matrix(tr)
-            cum = _mat_mult(cum, m)
-
-        # cum maps *element-local coords* -> *document coords*
-        # we need the inverse to map document page coords to element-local coords
-        inv = _mat_inverse(cum)
-        if inv is None:
-            # transform not invertible; fallback to translation-only approach (best effort)
-            inkex.errormsg(f"Warning: non-invertible transform for element {path.get('id')}; using translation-only fallback.")
-            # attempt the old tx,ty fallback (existing code path) so something still happens:
-            tx = 0.0; ty = 0.0
-            parent = path.getparent()
-            while parent is not None:
-                tr = parent.get('transform')
-                if tr:
-                    try:
-                        T = Transform(tr)
-                        tx += float(T.e)
-                        ty += float(T.f)
-                    except Exception:
-                        pass
-                parent = parent.getparent()
+        rect_x = -tx + page_left
+        rect_y = -ty + page_top
+        key = (_bucket(rect_x), _bucket(rect_y), width, height)
+        clip_id = self._clip_cache.get(key)
+        if clip_id is None:
             rect = Rectangle()
-            rect.set('x', str(-tx + page_left))
-            rect.set('y', str(-ty + page_top))
+            rect.set('x', str(rect_x))
+            rect.set('y', str(rect_y))
             rect.set('width', str(width))
             rect.set('height', str(height))
-            clip_id = self.svg.get_unique_id('clip_')
+
+            clip_id = self._next_clip_id()
             clip_path = inkex.ClipPath()
             clip_path.set('id', clip_id)
             clip_path.set('clipPathUnits', 'userSpaceOnUse')
             clip_path.append(rect)
-            if self.svg.defs is None:
-                self.svg.append(inkex.Defs())
-            self.svg.defs.append(clip_path)
-            path.set('clip-path', f'url(#{clip_id})')
-            return
-
-        # 2) rectangle corners in document coords
-        x0 = float(page_left)
-        y0 = float(page_top)
-        x1 = float(page_left + width)
-        y1 = float(page_top)
-        x2 = float(page_left + width)
-        y2 = float(page_top + height)
-        x3 = float(page_left)
-        y3 = float(page_top + height)
-
-        # 3) map to element-local coords using inverse
-        p0 = _apply_mat_to_point(inv, x0, y0)
-        p1 = _apply_mat_to_point(inv, x1, y1)
-        p2 = _apply_mat_to_point(inv, x2, y2)
-        p3 = _apply_mat_to_point(inv, x3, y3)
-
-        # 4) make a path for the transformed rectangle (a polygon path)
-        d = f"M{p0[0]},{p0[1]} L{p1[0]},{p1[1]} L{p2[0]},{p2[1]} L{p3[0]},{p3[1]} Z"
+
+            self._pending_clips.append(clip_path)
+            self._clip_cache[key] = clip_id
+
+        path.set('clip-path', f'url(#{clip_id})')
+
+    def apply_clip_to_path(self, path, cum, inv_cell, width, height):
+        """
+        Create a clipPath that clips `path` to the page rectangle,
+        correctly accounting for arbitrary ancestor+own transforms.
+
+        `cum` is the already-composed root->parent transform from the tree
+        walk and `inv_cell` its lazily filled inverse, shared by all
+        siblings under the same parent; only a path with its own transform
+        pays for a private inversion.
+        """
+        # 1) fold the path's own transform into the cumulative ancestor
+        #    transform (bounding-box checks use the parent space, clip
+        #    geometry lives in the path's local space)
+        tr = path.get('transform')
+        if tr:
+            cum = _mat_mult(cum, _parse_affine(tr))
+            inv = None
+        else:
+            # cum is exactly the shared ancestor matrix: reuse (or fill)
+            # the cached inverse
+            inv = inv_cell[0]
+
+        # cum maps *element-local coords* -> *document coords*
+        # we need the inverse to map document page coords to element-local coords
+        if inv is None:
+            if isclose(_mat_det(cum), 0.0, abs_tol=1e-12):
+                # transform not invertible; fallback to translation-only approach (best effort)
+                inkex.errormsg(f"Warning: non-invertible transform for element {path.get('id')}; using translation-only fallback.")
+                self.apply_clip_with_translation(path, cum[4], cum[5], width, height)
+                return
+            inv = _mat_inverse(cum)
+            if not tr:
+                inv_cell[0] = inv
+
+        # 2) map all four page corners to element-local coords in one
+        #    matmul instead of four per-point Python calls
+        a, b, c, d_, e, f = inv
+        inv_np = np.array([[a, c, e], [b, d_, f]], dtype=np.float64)
+        xs, ys = inv_np @ self._page_corners
+
+        # 3) make a path for the transformed rectangle (a polygon path)
+        d = (f"M{xs[0]},{ys[0]} L{xs[1]},{ys[1]} "
+             f"L{xs[2]},{ys[2]} L{xs[3]},{ys[3]} Z")
 
         # 5) create clipPath containing a path element
-        clip_id = self.svg.get_unique_id('clip_')
+        clip_id = self._next_clip_id()
         clip_path = inkex.ClipPath()
         clip_path.set('id', clip_id)
         clip_path.set('clipPathUnits', 'userSpaceOnUse')
@@ -261,9 +381,7 @@ class MassCropToPage(inkex.EffectExtension):
         clip_shape.set('d', d)
         clip_path.append(clip_shape)
 
-        if self.svg.defs is None:
-            self.svg.append(inkex.Defs())
-        self.svg.defs.append(clip_path)
+        self._pending_clips.append(clip_path)
 
         path.set('clip-path', f'url(#{clip_id})')
 